@@ -1,17 +1,65 @@
-from langchain_openai import ChatOpenAI
-from browser_use import Agent, Browser, Controller
-from browser_use import BrowserConfig
 from dotenv import load_dotenv
+import aiohttp
 import asyncio
-from pydantic import BaseModel
+import logging
+import orjson
+from pydantic import BaseModel, TypeAdapter, ValidationError
 import os
+import random
+import re
+import sys
+import time
+from selectolax.parser import HTMLParser
 
 # Load environment variables if any
 load_dotenv()
 
+logger = logging.getLogger('flare_monitor.agent')
+
 provider_address = os.getenv("PROVIDER_ADDRESS")
 network = os.getenv("NETWORK", "flare")
 
+# The systems-explorer page is a React app that loads its metrics from a JSON
+# endpoint, so we can fetch that directly instead of rendering the page.
+# Override EXPLORER_API_URL if the explorer's API path changes.
+EXPLORER_API_URL = os.getenv(
+    "EXPLORER_API_URL",
+    "https://{network}-systems-explorer.flare.network/api/v0/providers/ftso/{address}"
+)
+
+# Explorer page URL for the browser-agent fallback, interpolated once
+EXPLORER_PAGE_URL = f"https://{network}-systems-explorer.flare.network/providers/ftso/{{address}}"
+
+# How long to give the fast HTTP path before hedging with the browser agent
+FAST_PATH_HEDGE_SECONDS = float(os.getenv("FAST_PATH_HEDGE_SECONDS", "5"))
+
+# After this many consecutive permanent failures (4xx responses, non-JSON
+# bodies, schema mismatches) the fast path is assumed to be pointed at a
+# wrong endpoint and is skipped for the rest of the process, so a bad
+# EXPLORER_API_URL degrades to the browser path without per-tick failed
+# requests and warning noise
+FAST_PATH_MAX_PERMANENT_ERRORS = 3
+
+_fast_path_permanent_errors = 0
+_fast_path_disabled = False
+
+# Whether the browser agent may be launched when the fast HTTP path fails;
+# disabled via --no-browser-fallback for low-memory deployments
+_browser_fallback_enabled = True
+
+
+def disable_browser_fallback():
+    """Never launch the browser agent, even when the fast HTTP path fails"""
+    global _browser_fallback_enabled
+    _browser_fallback_enabled = False
+
+
+# Stale-while-revalidate cache TTLs: fresh entries are returned directly,
+# stale entries are returned immediately while a background task refreshes
+# them, and entries older than the stale TTL force a blocking fetch
+CACHE_FRESH_TTL_SECONDS = float(os.getenv("CACHE_FRESH_TTL_SECONDS", "300"))
+CACHE_STALE_TTL_SECONDS = float(os.getenv("CACHE_STALE_TTL_SECONDS", "900"))
+
 class RewardEpochInfo(BaseModel):
     primary: float
     secondary: float
@@ -24,76 +72,346 @@ class WebpageInfo(BaseModel):
     success_rate_24h: RewardEpochInfo
 
 
+# Compiled pydantic-core validator, built once and reused for every parse
+_VALIDATOR = TypeAdapter(WebpageInfo)
+
+
+# Shared LLM/browser/context/controller reused across monitoring cycles so
+# each check doesn't pay a fresh Chromium launch and LLM client init. The
+# context is created here and injected into each Agent: contexts the Agent
+# creates itself are closed at the end of run(), which would leave nothing
+# for the HTML post-processing step to read.
+_llm = None
+_browser = None
+_browser_context = None
+_controller = None
+_session_lock = asyncio.Lock()
+
+
+async def _get_session():
+    """Lazily create the shared LLM, browser, context and controller (once per process)"""
+    # Imported lazily so a steady-state tick on the fast HTTP path never pays
+    # the import cost (and RSS) of LangChain and the Chromium bindings
+    from langchain_openai import ChatOpenAI
+    from browser_use import Browser, BrowserConfig, Controller
+
+    global _llm, _browser, _browser_context, _controller
+    async with _session_lock:
+        if _browser is None:
+            _llm = ChatOpenAI(model="gpt-4o-mini")
+            _browser = Browser(config=BrowserConfig(
+                headless=True,
+                disable_security=False
+            ))
+            _browser_context = await _browser.new_context()
+            _controller = Controller(output_model=WebpageInfo)
+    return _llm, _browser, _browser_context, _controller
+
+
+async def close_browser():
+    """Close the shared browser so no Chromium processes linger on shutdown"""
+    global _browser, _browser_context
+    async with _session_lock:
+        if _browser_context is not None:
+            await _browser_context.close()
+            _browser_context = None
+        if _browser is not None:
+            await _browser.close()
+            _browser = None
+
+
+# Shared HTTP session for the fast path, reused across monitoring cycles
+_http_session = None
+
+
+async def _get_http_session():
+    """Lazily create the shared aiohttp session (once per process)"""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=10, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=30)
+        )
+    return _http_session
+
+
+async def close_http_session():
+    """Close the shared aiohttp session on shutdown"""
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+        _http_session = None
+
+
+async def get_provider_monitor_data_fast(custom_provider_address=None):
+    """
+    Get monitoring data straight from the explorer's JSON endpoint.
+
+    This is a single HTTPS round-trip instead of a headless browser session
+    plus LLM inference, so it is orders of magnitude faster and free.
+
+    Args:
+        custom_provider_address (str, optional): The provider's address.
+                                         If not provided, uses environment variable.
+
+    Returns:
+        WebpageInfo: Structured monitoring data including availability and success rates
+    """
+    current_provider_address = custom_provider_address or provider_address
+
+    if not current_provider_address:
+        raise ValueError("Provider address not provided and PROVIDER_ADDRESS not set in environment")
+
+    session = await _get_http_session()
+    url = EXPLORER_API_URL.format(network=network, address=current_provider_address)
+
+    async with session.get(url, headers={"Accept": "application/json"}) as response:
+        response.raise_for_status()
+        body = await response.read()
+
+    return _VALIDATOR.validate_python(orjson.loads(body))
+
+
+# Percentage patterns on the explorer page: success rates render as
+# 'primary % / secondary %' pairs, availability as single percentages
+_PCT_PAIR_RE = re.compile(r"(\d+(?:\.\d+)?)\s*%\s*/\s*(\d+(?:\.\d+)?)\s*%")
+_PCT_RE = re.compile(r"(\d+(?:\.\d+)?)\s*%")
+
+
+def _parse_metrics_html(html):
+    """
+    Parse the six metrics straight out of the rendered page HTML.
+
+    The page lists availability as single percentages and success rates as
+    'primary % / secondary %' pairs, each ordered 6h then 24h. Requires
+    exactly that shape (two singles, two pairs, all in 0-100) and returns
+    None otherwise, so an unrelated percentage elsewhere on the page can't
+    silently bind to a metric; the caller then falls back to the LLM's
+    extraction.
+    """
+    text = HTMLParser(html).text(separator=" ")
+    pairs = _PCT_PAIR_RE.findall(text)
+    singles = _PCT_RE.findall(_PCT_PAIR_RE.sub(" ", text))
+
+    if len(pairs) != 2 or len(singles) != 2:
+        return None
+
+    if not all(0 <= float(v) <= 100 for v in singles + [p for pair in pairs for p in pair]):
+        return None
+
+    return WebpageInfo(
+        availability_6h=float(singles[0]),
+        availability_24h=float(singles[1]),
+        success_rate_6h=RewardEpochInfo(primary=float(pairs[0][0]), secondary=float(pairs[0][1])),
+        success_rate_24h=RewardEpochInfo(primary=float(pairs[1][0]), secondary=float(pairs[1][1]))
+    )
+
+
+async def _first_successful(tasks):
+    """Wait for the first task to succeed, cancelling the rest"""
+    pending = set(tasks)
+    last_error = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            try:
+                result = task.result()
+            except Exception as e:
+                last_error = e
+                continue
+            for remaining in pending:
+                remaining.cancel()
+            return result
+    raise last_error
+
+
+# Stale-while-revalidate cache: (network, address) -> (WebpageInfo, fetched_at)
+_cache = {}
+# In-flight refresh tasks, shared between callers to avoid cache stampedes
+_cache_refreshes = {}
+
+
+async def _refresh_cache(cache_key, current_provider_address):
+    """Fetch fresh data and store it in the cache"""
+    try:
+        data = await _fetch_provider_monitor_data(current_provider_address)
+        _cache[cache_key] = (data, time.monotonic())
+        return data
+    finally:
+        _cache_refreshes.pop(cache_key, None)
+
+
+def _log_refresh_failure(task):
+    """Surface background refresh failures instead of leaving them unretrieved"""
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Background cache refresh failed: {task.exception()}")
+
+
 async def get_provider_monitor_data(custom_provider_address=None):
     """
     Get monitoring data for a Flare FTSO provider.
-    
+
+    Results are cached with stale-while-revalidate semantics: fresh entries
+    are returned directly, stale entries are returned immediately while a
+    background task refreshes them, and only a cache miss blocks on the
+    upstream fetch.
+
     Args:
-        custom_provider_address (str, optional): The provider's address. 
+        custom_provider_address (str, optional): The provider's address.
                                          If not provided, uses environment variable.
-    
+
     Returns:
         WebpageInfo: Structured monitoring data including availability and success rates
     """
     # Use the provided address or fall back to the environment variable
     current_provider_address = custom_provider_address or provider_address
-        
+
     if not current_provider_address:
         raise ValueError("Provider address not provided and PROVIDER_ADDRESS not set in environment")
-    
-    llm = ChatOpenAI(model="gpt-4o-mini")
-    
-    # Configure the browser to run in headless mode
-    browser_config = BrowserConfig(
-        headless=True,
-        disable_security=False
-    )
-    
+
+    cache_key = (network, current_provider_address)
+    cached = _cache.get(cache_key)
+
+    if cached:
+        data, fetched_at = cached
+        age = time.monotonic() - fetched_at
+        if age < CACHE_FRESH_TTL_SECONDS:
+            return data
+        if age < CACHE_STALE_TTL_SECONDS:
+            # Serve stale data immediately and refresh in the background;
+            # nothing awaits the task, so log its failure via a done-callback
+            if cache_key not in _cache_refreshes:
+                refresh = asyncio.create_task(
+                    _refresh_cache(cache_key, current_provider_address)
+                )
+                refresh.add_done_callback(_log_refresh_failure)
+                _cache_refreshes[cache_key] = refresh
+            return data
+
+    # Cache miss (or entry too stale to serve): block on a refresh, sharing
+    # any in-flight one so concurrent callers trigger a single fetch
+    refresh = _cache_refreshes.get(cache_key)
+    if refresh is None:
+        refresh = asyncio.create_task(_refresh_cache(cache_key, current_provider_address))
+        _cache_refreshes[cache_key] = refresh
+    return await refresh
+
+
+async def _fetch_provider_monitor_data(current_provider_address):
+    """
+    Fetch monitoring data from upstream, bypassing the cache.
+
+    Tries the fast HTTP path first. If it fails outright, falls back to the
+    browser agent; if it merely stalls, hedges by racing it against the
+    browser agent and taking whichever finishes first.
+    """
+    global _fast_path_permanent_errors, _fast_path_disabled
+
+    if _fast_path_disabled and _browser_fallback_enabled:
+        return await _get_provider_monitor_data_browser(current_provider_address)
+
+    fast_task = asyncio.create_task(get_provider_monitor_data_fast(current_provider_address))
+    try:
+        result = await asyncio.wait_for(asyncio.shield(fast_task), FAST_PATH_HEDGE_SECONDS)
+        _fast_path_permanent_errors = 0
+        return result
+    except asyncio.TimeoutError:
+        if not _browser_fallback_enabled:
+            return await fast_task
+        logger.warning("Fast HTTP path is slow, hedging with the browser agent")
+    except Exception as fast_error:
+        # A 4xx, a non-JSON body (an SPA host typically serves its HTML
+        # shell with a 200 for unknown /api paths) or a schema mismatch all
+        # mean the endpoint is wrong, not that upstream is flaky; trip the
+        # breaker after a few in a row instead of retrying forever
+        is_permanent = (
+            (isinstance(fast_error, aiohttp.ClientResponseError) and fast_error.status < 500)
+            or isinstance(fast_error, (orjson.JSONDecodeError, ValidationError))
+        )
+        if is_permanent:
+            _fast_path_permanent_errors += 1
+            # Log only on the transition: with the fallback disabled the
+            # counter keeps climbing but the breaker stays advisory
+            if _fast_path_permanent_errors == FAST_PATH_MAX_PERMANENT_ERRORS:
+                _fast_path_disabled = True
+                logger.warning(
+                    f"Fast HTTP path failed {_fast_path_permanent_errors} consecutive times with "
+                    "permanent errors; disabling it for this process (check EXPLORER_API_URL)"
+                )
+        if not _browser_fallback_enabled:
+            raise
+        fast_task = None
+        logger.warning(f"Fast HTTP path failed ({fast_error}), falling back to browser agent")
+
+    browser_task = asyncio.create_task(_get_provider_monitor_data_browser(current_provider_address))
+    tasks = {browser_task, fast_task} if fast_task else {browser_task}
+    return await _first_successful(tasks)
+
+
+# Serializes browser fetches: agents share one browser context, so two of
+# them running concurrently would interleave navigations and the HTML
+# post-processing could read the page of the other provider's agent
+_browser_fetch_lock = asyncio.Lock()
+
+
+async def _get_provider_monitor_data_browser(current_provider_address):
+    """Get monitoring data by driving the explorer page with the browser agent"""
+    import openai
+    from browser_use import Agent
+
+    llm, browser, browser_context, controller = await _get_session()
+
+    url = EXPLORER_PAGE_URL.format(address=current_provider_address)
+
+    # Keep the prompt terse: the controller's output_model already enforces
+    # the WebpageInfo schema, so an example block would just burn input tokens
     agent = Agent(
-        task=f"""
-          Navigate to 'https://{network}-systems-explorer.flare.network/providers/ftso/{current_provider_address}' and return availability and success rates.
-          example:
-
-          Availability
-          Success Rate
-          LAST 6 HOURS
-          99.87 %
-          LAST 6 HOURS
-          48.80 % / 95.87 %
-          LAST 24 HOURS
-          99.45 %
-          LAST 24 HOURS
-          46.60 % / 95.85 %
-          LAST 6 HOURS
-          48.80 % / 95.87 %
-
-          The output should be in the following format:
-          {{
-            "availability_6h": 90.87,
-            "availability_24h": 99.45,
-            "success_rate_6h": {{
-              "primary": 48.80,
-              "secondary": 95.87
-            }},
-            "success_rate_24h": {{
-              "primary": 46.60,
-              "secondary": 95.85
-            }}
-          }}
-        """,
+        task=(
+            f"Open '{url}'. "
+            "Extract availability (6h, 24h) and success_rate (6h primary/secondary, "
+            "24h primary/secondary) from the FTSO provider table. "
+            "Return the WebpageInfo JSON. "
+            "Batch browser actions aggressively; each tool call costs 3-5s."
+        ),
         llm=llm,
-        browser=Browser(config=browser_config),
-        controller=Controller(output_model=WebpageInfo)
+        browser=browser,
+        browser_context=browser_context,
+        controller=controller
     )
-    
-    # Run the agent
+
+    # The agent run and the HTML read must happen under the lock so the page
+    # we parse is the one this agent navigated to
+    async with _browser_fetch_lock:
+        # Run the agent, retrying transient failures in place with jittered
+        # exponential backoff instead of discarding the whole monitoring slot
+        attempts = 3
+        for attempt in range(attempts):
+            try:
+                history = await agent.run()
+                break
+            except (TimeoutError, aiohttp.ClientError, openai.RateLimitError) as transient_error:
+                if attempt + 1 == attempts:
+                    raise Exception(f"An error occurred while getting provider data: {transient_error}")
+                logger.warning(f"Transient error from browser agent (attempt {attempt + 1}/{attempts}): {transient_error}")
+                await asyncio.sleep(2 ** attempt + random.random())
+
+        # The rendered DOM already contains the six metrics, so parse them
+        # with a compiled HTML parser and only trust the LLM's extraction if
+        # that misses
+        try:
+            page = await browser_context.get_current_page()
+            parsed_from_html = _parse_metrics_html(await page.content())
+            if parsed_from_html is not None:
+                return parsed_from_html
+        except Exception as html_error:
+            logger.warning(f"HTML post-processing failed ({html_error}), using LLM extraction")
+
     try:
-        history = await agent.run()
         result = history.final_result()
-        
+
         if result:
             try:
-                parsed_result = WebpageInfo.model_validate_json(result)
+                parsed_result = _VALIDATOR.validate_json(result)
                 return parsed_result
             except Exception as parse_error:
                 raise Exception(f"Error parsing result: {parse_error}. Raw result: {result}")
@@ -106,7 +424,7 @@ async def get_provider_monitor_data(custom_provider_address=None):
 async def main():
     try:
         provider_data = await get_provider_monitor_data()
-        
+
         print("\nScraping Results (structured):")
         print(f"Availability 6h: {provider_data.availability_6h}")
         print(f"Availability 24h: {provider_data.availability_24h}")
@@ -114,6 +432,17 @@ async def main():
         print(f"Success Rate 24h: {provider_data.success_rate_24h}")
     except Exception as e:
         print(f"An error occurred: {e}")
+    finally:
+        await close_browser()
+        await close_http_session()
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    if "--no-browser-fallback" in sys.argv:
+        disable_browser_fallback()
+    if sys.platform != "win32":
+        try:
+            import uvloop
+            uvloop.install()
+        except ImportError:
+            pass  # fall back to the default event loop
+    asyncio.run(main())
\ No newline at end of file
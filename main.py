@@ -1,11 +1,16 @@
+import aiohttp
 import asyncio
+import hashlib
+import math
 import time
 import os
-import requests
+import sys
 import logging
+import numpy as np
+from dataclasses import dataclass
 from dotenv import load_dotenv
 from datetime import datetime
-from agent import get_provider_monitor_data
+from agent import get_provider_monitor_data, close_browser, close_http_session, disable_browser_fallback
 
 # Load environment variables
 load_dotenv()
@@ -30,81 +35,165 @@ DEFAULT_THRESHOLDS = {
     "min_success_rate_24h_secondary": 85.0,  # 85%
 }
 
+@dataclass(frozen=True, slots=True)
+class Thresholds:
+    """Alert thresholds, resolved from environment variables once at startup"""
+    min_availability_6h: float
+    min_availability_24h: float
+    min_success_rate_6h_primary: float
+    min_success_rate_6h_secondary: float
+    min_success_rate_24h_primary: float
+    min_success_rate_24h_secondary: float
+
+def _load_thresholds():
+    """Resolve thresholds from environment variables or defaults, rejecting NaN/Inf"""
+    values = {}
+    for key, default_value in DEFAULT_THRESHOLDS.items():
+        env_value = os.getenv(key.upper())
+        value = float(env_value) if env_value else default_value
+        if not math.isfinite(value):
+            raise ValueError(f"Threshold {key.upper()} must be a finite number, got: {env_value}")
+        values[key] = value
+    return Thresholds(**values)
+
+THRESHOLDS = _load_thresholds()
+
+# Metric labels and thresholds in a fixed order, so a tick's checks are one
+# vectorized comparison and the common all-green case skips all formatting
+_METRIC_LABELS = (
+    "6h Availability",
+    "24h Availability",
+    "6h Primary Success Rate",
+    "6h Secondary Success Rate",
+    "24h Primary Success Rate",
+    "24h Secondary Success Rate",
+)
+_THRESHOLD_VEC = np.array([
+    THRESHOLDS.min_availability_6h,
+    THRESHOLDS.min_availability_24h,
+    THRESHOLDS.min_success_rate_6h_primary,
+    THRESHOLDS.min_success_rate_6h_secondary,
+    THRESHOLDS.min_success_rate_24h_primary,
+    THRESHOLDS.min_success_rate_24h_secondary,
+], dtype=np.float64)
+
 # Monitoring interval in seconds
 DEFAULT_MONITORING_INTERVAL = 15 * 60  # 15 minutes
 
+# How long to wait before re-sending an unchanged alert for the same provider
+DEFAULT_RENOTIFY_SECONDS = 6 * 60 * 60  # 6 hours
+RENOTIFY_SECONDS = float(os.getenv("RENOTIFY_SECONDS", DEFAULT_RENOTIFY_SECONDS))
+
+# Last alert digest and send time per provider address, used to suppress
+# repeats of the same alert on every tick while a provider stays degraded
+_last_alert_state = {}
+
 # Get telegram configuration from environment variables
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 
-def send_telegram_alert(message):
+# Default provider address, read once at startup
+PROVIDER_ADDRESS = os.getenv("PROVIDER_ADDRESS")
+
+# Shared HTTP session for Telegram calls, created lazily and reused
+_telegram_session = None
+
+async def _get_telegram_session():
+    """Lazily create the shared aiohttp session used for Telegram calls"""
+    global _telegram_session
+    if _telegram_session is None or _telegram_session.closed:
+        _telegram_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+    return _telegram_session
+
+async def close_telegram_session():
+    """Close the shared Telegram session on shutdown"""
+    global _telegram_session
+    if _telegram_session is not None and not _telegram_session.closed:
+        await _telegram_session.close()
+        _telegram_session = None
+
+async def send_telegram_alert(message):
     """Send an alert message using Telegram bot"""
     if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
         logger.warning("Telegram bot token or chat ID not configured. Cannot send alert.")
         return False
-    
+
     url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
     payload = {
         "chat_id": TELEGRAM_CHAT_ID,
         "text": message,
         "parse_mode": "Markdown"
     }
-    
+
     try:
-        response = requests.post(url, json=payload, timeout=10)
-        response.raise_for_status()
+        session = await _get_telegram_session()
+        async with session.post(url, json=payload) as response:
+            response.raise_for_status()
         logger.info(f"Telegram alert sent successfully: {message}")
         return True
     except Exception as e:
         logger.error(f"Failed to send Telegram alert: {e}")
         return False
 
-def get_thresholds():
-    """Get threshold values from environment variables or use defaults"""
-    thresholds = {}
-    for key, default_value in DEFAULT_THRESHOLDS.items():
-        env_value = os.getenv(key.upper())
-        thresholds[key] = float(env_value) if env_value else default_value
-    return thresholds
-
 async def check_provider_data(custom_provider_address=None):
     """Check provider data against thresholds and send alerts if needed"""
-    thresholds = get_thresholds()
-    
     try:
         provider_data = await get_provider_monitor_data(custom_provider_address)
-        logger.info(f"Provider data retrieved successfully: {provider_data}")
-        
-        alerts = []
+        # Lazy %-formatting: the pydantic __repr__ only runs if INFO is
+        # enabled; the extra fields feed structured/JSON log formatters
+        logger.info(
+            "Provider data retrieved successfully: %r",
+            provider_data,
+            extra={
+                "availability_6h": provider_data.availability_6h,
+                "availability_24h": provider_data.availability_24h,
+                "success_rate_6h_primary": provider_data.success_rate_6h.primary,
+                "success_rate_6h_secondary": provider_data.success_rate_6h.secondary,
+                "success_rate_24h_primary": provider_data.success_rate_24h.primary,
+                "success_rate_24h_secondary": provider_data.success_rate_24h.secondary,
+            }
+        )
         
-        # Check availability thresholds
-        if provider_data.availability_6h < thresholds["min_availability_6h"]:
-            alerts.append(f"⚠️ 6h Availability is low: {provider_data.availability_6h}% (threshold: {thresholds['min_availability_6h']}%)")
-        
-        if provider_data.availability_24h < thresholds["min_availability_24h"]:
-            alerts.append(f"⚠️ 24h Availability is low: {provider_data.availability_24h}% (threshold: {thresholds['min_availability_24h']}%)")
-        
-        # Check success rate thresholds
-        if provider_data.success_rate_6h.primary < thresholds["min_success_rate_6h_primary"]:
-            alerts.append(f"⚠️ 6h Primary Success Rate is low: {provider_data.success_rate_6h.primary}% (threshold: {thresholds['min_success_rate_6h_primary']}%)")
-        
-        if provider_data.success_rate_6h.secondary < thresholds["min_success_rate_6h_secondary"]:
-            alerts.append(f"⚠️ 6h Secondary Success Rate is low: {provider_data.success_rate_6h.secondary}% (threshold: {thresholds['min_success_rate_6h_secondary']}%)")
-        
-        if provider_data.success_rate_24h.primary < thresholds["min_success_rate_24h_primary"]:
-            alerts.append(f"⚠️ 24h Primary Success Rate is low: {provider_data.success_rate_24h.primary}% (threshold: {thresholds['min_success_rate_24h_primary']}%)")
-        
-        if provider_data.success_rate_24h.secondary < thresholds["min_success_rate_24h_secondary"]:
-            alerts.append(f"⚠️ 24h Secondary Success Rate is low: {provider_data.success_rate_24h.secondary}% (threshold: {thresholds['min_success_rate_24h_secondary']}%)")
+        # Compare all metrics against their thresholds in one vectorized pass;
+        # alert messages are only formatted for the metrics that breached
+        values = np.array([
+            provider_data.availability_6h,
+            provider_data.availability_24h,
+            provider_data.success_rate_6h.primary,
+            provider_data.success_rate_6h.secondary,
+            provider_data.success_rate_24h.primary,
+            provider_data.success_rate_24h.secondary,
+        ], dtype=np.float64)
+        breached = values < _THRESHOLD_VEC
+
+        alerts = [
+            f"⚠️ {_METRIC_LABELS[i]} is low: {values[i]}% (threshold: {_THRESHOLD_VEC[i]}%)"
+            for i in np.flatnonzero(breached)
+        ] if breached.any() else []
         
-        # Send alerts if any
+        # Send alerts if any, suppressing repeats of an unchanged alert until
+        # the re-notify window has passed
+        monitored_address = custom_provider_address or PROVIDER_ADDRESS or "Unknown"
         if alerts:
-            monitored_address = custom_provider_address or os.getenv("PROVIDER_ADDRESS", "Unknown")
-            message = f"*FLARE PROVIDER ALERT*\n\nProvider: `{monitored_address}`\n\n" + "\n".join(alerts)
-            message += f"\n\n_Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}_"
-            send_telegram_alert(message)
-            logger.warning(f"Alerts detected: {alerts}")
+            # Hash which metrics breached, not the message text: the messages
+            # embed live values that drift every tick, which would defeat the
+            # debounce for a persistently degraded provider
+            breached_labels = "|".join(_METRIC_LABELS[i] for i in np.flatnonzero(breached))
+            digest = hashlib.blake2b(breached_labels.encode(), digest_size=8).hexdigest()
+            previous = _last_alert_state.get(monitored_address)
+            now = time.time()
+            if previous and previous[0] == digest and now - previous[1] < RENOTIFY_SECONDS:
+                logger.info("Suppressing unchanged alert for %s (already sent %.0fs ago)", monitored_address, now - previous[1])
+            else:
+                message = f"*FLARE PROVIDER ALERT*\n\nProvider: `{monitored_address}`\n\n" + "\n".join(alerts)
+                message += f"\n\n_Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}_"
+                if await send_telegram_alert(message):
+                    _last_alert_state[monitored_address] = (digest, now)
+            logger.warning("Alerts detected: %s", alerts)
         else:
+            # Forget the last alert once the provider recovers, so a new
+            # degradation alerts immediately
+            _last_alert_state.pop(monitored_address, None)
             logger.info("All provider metrics are within acceptable thresholds")
         
         return provider_data, alerts
@@ -112,38 +201,60 @@ async def check_provider_data(custom_provider_address=None):
     except Exception as e:
         error_message = f"Error checking provider data: {str(e)}"
         logger.error(error_message)
-        send_telegram_alert(f"*FLARE PROVIDER MONITOR ERROR*\n\n{error_message}")
+        await send_telegram_alert(f"*FLARE PROVIDER MONITOR ERROR*\n\n{error_message}")
         return None, [error_message]
 
 async def monitor_loop():
     """Main monitoring loop that runs at specified intervals"""
     interval = int(os.getenv("MONITORING_INTERVAL", DEFAULT_MONITORING_INTERVAL))
-    provider_address = os.getenv("PROVIDER_ADDRESS")
-    
-    if not provider_address:
-        error_msg = "PROVIDER_ADDRESS environment variable is not set!"
+
+    # PROVIDER_ADDRESSES is a comma-separated list; fall back to the single
+    # PROVIDER_ADDRESS for backwards compatibility
+    provider_addresses = [a.strip() for a in os.getenv("PROVIDER_ADDRESSES", "").split(",") if a.strip()]
+    if not provider_addresses and PROVIDER_ADDRESS:
+        provider_addresses = [PROVIDER_ADDRESS]
+
+    if not provider_addresses:
+        error_msg = "Neither PROVIDER_ADDRESSES nor PROVIDER_ADDRESS environment variable is set!"
         logger.error(error_msg)
-        send_telegram_alert(f"*FLARE PROVIDER MONITOR ERROR*\n\n{error_msg}")
+        await send_telegram_alert(f"*FLARE PROVIDER MONITOR ERROR*\n\n{error_msg}")
         return
-        
-    logger.info(f"Starting Flare FTSO provider monitoring for address: {provider_address}")
+
+    logger.info(f"Starting Flare FTSO provider monitoring for address(es): {', '.join(provider_addresses)}")
     logger.info(f"Monitoring interval: {interval} seconds")
-    
+
+    # Schedule ticks against absolute monotonic deadlines so wakeup jitter
+    # and per-tick variance don't accumulate as drift over long runs
+    loop = asyncio.get_running_loop()
+    next_deadline = loop.time()
+
     while True:
         try:
-            start_time = time.time()
-            await check_provider_data(provider_address)
-            
-            # Calculate how long to sleep to maintain the desired interval
-            elapsed = time.time() - start_time
-            sleep_time = max(0, interval - elapsed)
-            
+            next_deadline += interval
+
+            # Check all providers concurrently; their waits are I/O-bound
+            results = await asyncio.gather(
+                *(check_provider_data(address) for address in provider_addresses),
+                return_exceptions=True
+            )
+            for address, result in zip(provider_addresses, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Unhandled error while checking provider {address}: {result}")
+
+            # If a tick overran past one or more deadlines, skip them rather
+            # than firing a burst of back-to-back checks to catch up
+            if next_deadline < loop.time():
+                missed = 0
+                while next_deadline < loop.time():
+                    next_deadline += interval
+                    missed += 1
+                logger.warning(f"Monitor check overran the interval ({interval}s); skipping {missed} missed tick(s)")
+
+            sleep_time = max(0, next_deadline - loop.time())
             if sleep_time > 0:
-                logger.info(f"Waiting {sleep_time:.2f} seconds until next check...")
+                logger.info("Waiting %.2f seconds until next check...", sleep_time)
                 await asyncio.sleep(sleep_time)
-            else:
-                logger.warning(f"Monitor check took {elapsed:.2f}s, longer than the interval ({interval}s)")
-        
+
         except Exception as e:
             logger.error(f"Error in monitor loop: {e}")
             await asyncio.sleep(60)  # Wait a minute if there's an error
@@ -160,6 +271,19 @@ async def main():
         logger.info("Monitoring stopped by user")
     except Exception as e:
         logger.error(f"Monitoring terminated due to error: {e}")
+    finally:
+        # Make sure the shared browser and HTTP sessions are shut down cleanly
+        await close_browser()
+        await close_http_session()
+        await close_telegram_session()
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    if "--no-browser-fallback" in sys.argv:
+        disable_browser_fallback()
+    if sys.platform != "win32":
+        try:
+            import uvloop
+            uvloop.install()
+        except ImportError:
+            pass  # fall back to the default event loop
+    asyncio.run(main())
\ No newline at end of file